@@ -1,9 +1,10 @@
-import json
 import logging
 from typing import Optional
 
+import orjson
 from fastapi import FastAPI, Query, HTTPException, status, Form, File, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from starlette.responses import StreamingResponse
 
 from app.schemas.exam import Exam
@@ -11,10 +12,15 @@ from app.schemas.file import InputFileType, OutputFileType
 from app.services.file_service import FileService
 from app.services.gemini_service import GeminiService
 
+# Precomputed lookups for validating file types on each request
+_IN_SUFFIXES = tuple(f".{ft.value}" for ft in InputFileType)
+_OUT_VALUES = frozenset(ft.value for ft in OutputFileType)
+
 app = FastAPI(
     title="Exam Generator API",
     description="API for generating mock exams using Google Gemini.",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Configure the logger
@@ -27,6 +33,9 @@ logging.basicConfig(
     ]
 )
 
+# Module-level logger
+logger = logging.getLogger(__name__)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -43,7 +52,7 @@ app.add_middleware(
 try:
     gemini_service = GeminiService()
 except ValueError as e:
-    print(f"FATAL ERROR: {e}")
+    logger.critical("FATAL ERROR: %s", e)
     exit(1)
 
 @app.post("/v1/exams/generate",
@@ -58,9 +67,9 @@ async def generate_exam(
     exam_guide_content: str = Form(""),
     additional_info: str = Form(""),
     exam_guide_file: Optional[UploadFile] = File(None)
-) -> Exam:
+) -> ORJSONResponse:
     try:
-        parsed_question_types = json.loads(question_types)
+        parsed_question_types = orjson.loads(question_types)
 
         if not exam_guide_content and not exam_guide_file:
             raise HTTPException(
@@ -85,12 +94,10 @@ async def generate_exam(
 
             filename_lower = exam_guide_file.filename.lower()
 
-            supported_extensions = [filetype.value for filetype in InputFileType]
-
-            if not any(filename_lower.endswith(f".{ext}") for ext in supported_extensions):
+            if not filename_lower.endswith(_IN_SUFFIXES):
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Unsupported file type. Supported: {supported_extensions}"
+                    detail=f"Unsupported file type. Supported: {[ft.value for ft in InputFileType]}"
                 )
 
             try:
@@ -107,8 +114,8 @@ async def generate_exam(
                 detail="No content found to generate exam from."
             )
 
-        # Call the GeminiService to generate the exam content
-        gemini_response = gemini_service.generate_exam(
+        # Call the GeminiService to generate the exam content, validated against the `Exam` model
+        generated_exam = await gemini_service.generate_exam(
             number_of_questions=num_questions,
             difficulty=difficulty,
             question_types=parsed_question_types,
@@ -116,29 +123,21 @@ async def generate_exam(
             additional_info=additional_info
         )
 
-        # The `gemini_response.parsed` attribute holds the Python object
-        # that results from parsing the JSON response, which should conform
-        # to your `Exam` Pydantic model due to the `response_schema` in GeminiService.
-        if not gemini_response.parsed:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Gemini API returned an empty or unparseable response."
-            )
-
-        # Validate the parsed response against the Exam Pydantic model.
-        # This adds an extra layer of safety to ensure the structure is correct
-        # before returning it. If the structure doesn't match, Pydantic will raise a ValidationError.
-        generated_exam = Exam.model_validate(gemini_response.parsed)
-
-        return generated_exam
+        # GeminiService has already validated the exam, so return it directly
+        # instead of letting FastAPI re-validate it against `response_model`
+        return ORJSONResponse(generated_exam.model_dump(mode="json"))
 
+    except HTTPException:
+        raise
     except RuntimeError as e:
-        # Catch specific RuntimeErrors raised by GeminiService (e.g., API call failures)
+        # Catch specific RuntimeErrors raised by GeminiService (e.g., API call failures, invalid exams)
+        logger.exception("Error generating exam from Gemini: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error generating exam from Gemini: {e}"
         )
     except Exception as e:
+        logger.exception("Unexpected error in generate_exam: %s (%s)", e, type(e).__name__)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"An unexpected error occurred while processing the request: {e}"
@@ -146,7 +145,7 @@ async def generate_exam(
 
 @app.post("/v1/exams/download", response_class=StreamingResponse)
 def download_exam(exam: Exam, file_type: str = Query(...)):
-    if file_type not in [ft.value for ft in OutputFileType]:
+    if file_type not in _OUT_VALUES:
         raise HTTPException(status_code=400, detail="Invalid file type")
 
     return FileService.create_file_stream(exam, file_type)
\ No newline at end of file
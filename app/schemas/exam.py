@@ -1,7 +1,7 @@
 import enum
-from typing import List, Optional, Union, Literal
+from typing import Annotated, List, Optional, Union, Literal
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class Difficulty(str, enum.Enum):
@@ -41,12 +41,20 @@ class EssayQuestion(QuestionBase):
     type: Literal[QuestionType.Essay]
     guidelines: str
 
-# Union of all question types
-Question = Union[
-    MultipleChoiceQuestion,
-    TrueFalseQuestion,
-    ShortAnswerQuestion,
-    EssayQuestion
+def _as_any_of(schema: dict) -> None:
+    # Gemini's response schema has no `oneOf`/`discriminator`, so publish the union as `anyOf`
+    schema.pop("discriminator", None)
+    schema["anyOf"] = schema.pop("oneOf")
+
+# Union of all question types, discriminated by the `type` field
+Question = Annotated[
+    Union[
+        MultipleChoiceQuestion,
+        TrueFalseQuestion,
+        ShortAnswerQuestion,
+        EssayQuestion
+    ],
+    Field(discriminator="type", json_schema_extra=_as_any_of)
 ]
 
 class Exam(BaseModel):
@@ -1,54 +1,34 @@
+import asyncio
+import codecs
 import logging
-import os
-import tempfile
-from io import StringIO, BytesIO
+import string
+import threading
+from io import BytesIO
+from typing import Iterator
 
-import PyPDF2
+import pypdfium2 as pdfium
 from docx import Document
 from fastapi import UploadFile, HTTPException
 from fastapi.responses import StreamingResponse
 
 from app.schemas.exam import Exam
+from app.schemas.file import InputFileType
 
 logger = logging.getLogger(__name__)
 
+# Size of the chunks read from uploaded files
+CHUNK_SIZE = 64 * 1024
 
-class FileService:
-    @staticmethod
-    def create_file_stream(exam: Exam, file_type: str) -> StreamingResponse:
-        buffer = StringIO()
-
-        buffer.write(f"Exam Title: {exam.exam_title}\n")
-        buffer.write(f"Questions: {exam.total_questions}\n")
-        buffer.write(f"Difficulty: {exam.difficulty}\n")
-        buffer.write(f"Estimated Time: {exam.estimated_completion_minutes} minutes\n")
-        buffer.write(f"Types: {', '.join(exam.question_types)}\n")
-        buffer.write("\n" + "=" * 40 + "\n\n")
-
-        for q in exam.questions:
-            buffer.write(f"Question {q.id} [{q.type} - {q.difficulty}]\n{q.question}\n\n")
-
-            if q.type == "Multiple Choice":
-                for i, option in enumerate(q.options):
-                    buffer.write(f"{chr(65 + i)}. {option}\n")
+# PDFium is not thread-safe, so only one thread may use it at a time
+_pdfium_lock = threading.Lock()
 
-            if q.type == "Essay":
-                buffer.write(f"Guidelines: {q.guidelines}\n")
+# Letter prefixes for multiple choice options ("A. ", "B. ", ...)
+_OPTION_PREFIXES = tuple(f"{letter}. " for letter in string.ascii_uppercase)
 
-            buffer.write("\n" + "-" * 40 + "\n\n")
-
-        buffer.write("\nANSWER KEY\n" + "=" * 40 + "\n\n")
-        for q in exam.questions:
-            if q.type == "Multiple Choice" or q.type == "True/False":
-                buffer.write(f"Question {q.id}: {q.correct_answer}\n")
-            if q.type == "Short Answer":
-                buffer.write(f"Question {q.id}: [Sample Answer] {q.sample_answer}\n")
-            if q.type == "Essay":
-                buffer.write(f"Question {q.id}: Not Applicable\n")
-
-        # Reset cursor
-        buffer.seek(0)
 
+class FileService:
+    @staticmethod
+    def create_file_stream(exam: Exam, file_type: str) -> StreamingResponse:
         filename = f"{exam.exam_title.replace(' ', '_')}.{file_type}"
 
         mime_map = {
@@ -57,11 +37,53 @@ class FileService:
         }
 
         return StreamingResponse(
-            buffer,
+            FileService._render_exam(exam),
             media_type=mime_map.get(file_type),
             headers={"Content-Disposition": f"attachment; filename={filename}"}
         )
 
+    @staticmethod
+    def _render_exam(exam: Exam) -> Iterator[str]:
+        """Yield the exam document piece by piece so it can be streamed to the client"""
+        yield "".join((
+            f"Exam Title: {exam.exam_title}\n",
+            f"Questions: {exam.total_questions}\n",
+            f"Difficulty: {exam.difficulty}\n",
+            f"Estimated Time: {exam.estimated_completion_minutes} minutes\n",
+            f"Types: {', '.join(exam.question_types)}\n",
+            "\n" + "=" * 40 + "\n\n",
+        ))
+
+        # The answer key is collected while walking the questions once
+        answer_parts = []
+        add_answer = answer_parts.append
+        for q in exam.questions:
+            q_id, q_type = q.id, q.type
+            # Each question is emitted as a single chunk
+            parts = [f"Question {q_id} [{q_type} - {q.difficulty}]\n{q.question}\n\n"]
+
+            if q_type == "Multiple Choice":
+                options = q.options
+                if len(options) <= len(_OPTION_PREFIXES):
+                    parts.append("".join(map(str.__add__, _OPTION_PREFIXES, (option + "\n" for option in options))))
+                else:
+                    # Past "Z" fall back to chr()-based labels rather than dropping options
+                    for i, option in enumerate(options):
+                        parts.append(f"{chr(65 + i)}. {option}\n")
+                add_answer(f"Question {q_id}: {q.correct_answer}\n")
+            elif q_type == "True/False":
+                add_answer(f"Question {q_id}: {q.correct_answer}\n")
+            elif q_type == "Short Answer":
+                add_answer(f"Question {q_id}: [Sample Answer] {q.sample_answer}\n")
+            elif q_type == "Essay":
+                parts.append(f"Guidelines: {q.guidelines}\n")
+                add_answer(f"Question {q_id}: Not Applicable\n")
+
+            parts.append("\n" + "-" * 40 + "\n\n")
+            yield "".join(parts)
+
+        yield "\nANSWER KEY\n" + "=" * 40 + "\n\n" + "".join(answer_parts)
+
     @staticmethod
     async def read_file(file: UploadFile) -> str:
         """
@@ -73,7 +95,7 @@ class FileService:
         3. Better encoding handling for text files
         4. Input validation
         5. Support for DOC files
-        6. Memory-based processing where possible (no temp files for PDF)
+        6. Memory-based processing where possible (no temp files for PDF or DOCX)
         """
 
         logger.info("Reading file with name: %s", file.filename)
@@ -88,18 +110,15 @@ class FileService:
         extension = filename.split(".")[-1]
 
         try:
-            if extension == "txt":
-                return await FileService._read_txt_file(file)
-            elif extension == "docx":
-                return await FileService._read_docx_file(file)
-            elif extension == "pdf":
-                return await FileService._read_pdf_file(file)
-            else:
+            reader = _READERS.get(extension)
+            if reader is None:
                 raise HTTPException(
                     status_code=400,
-                    detail=f"Unsupported file format: {extension}. Supported: txt, docx, doc, pdf"
+                    detail=f"Unsupported file format: {extension}. Supported: {', '.join(_READERS)}"
                 )
 
+            return await reader(file)
+
         except HTTPException:
             raise
         except Exception as e:
@@ -113,65 +132,59 @@ class FileService:
         logger.info("Reading text file with name: " + file.filename)
         content = await file.read()
 
-        # Try multiple encodings
-        encodings = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
+        # A BOM identifies UTF-32/UTF-16, otherwise try UTF-8 (with or without BOM) and cp1252.
+        # latin-1 never fails, so it is the last resort.
+        if content.startswith((codecs.BOM_UTF32_LE, codecs.BOM_UTF32_BE)):
+            encodings = ['utf-32', 'latin-1']
+        elif content.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+            encodings = ['utf-16', 'latin-1']
+        else:
+            encodings = ['utf-8-sig', 'cp1252', 'latin-1']
+
         for encoding in encodings:
             try:
                 text = content.decode(encoding)
-                if text.strip():  # Ensure we got actual content
-                    return text
+                break
             except UnicodeDecodeError:
                 continue
 
-        raise HTTPException(status_code=400, detail="Could not decode text file")
+        if not text.strip():  # Ensure we got actual content
+            raise HTTPException(status_code=400, detail="Could not decode text file")
+
+        return text
 
     @staticmethod
     async def _read_docx_file(file: UploadFile) -> str:
-        """Read DOCX file using temporary file"""
+        """Read DOCX file using memory stream (no temp file needed)"""
         logger.info("Reading DOCX file with name: " + file.filename)
-        content = await file.read()
-        temp_file = None
 
-        try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".docx") as tmp:
-                temp_file = tmp.name
-                tmp.write(content)
-                tmp.flush()
+        docx_stream = BytesIO()
+        while chunk := await file.read(CHUNK_SIZE):
+            docx_stream.write(chunk)
+        docx_stream.seek(0)
 
-                doc = Document(tmp.name)
-                text_content = "\n".join([para.text for para in doc.paragraphs])
+        doc = Document(docx_stream)
+        text_content = "\n".join(para.text for para in doc.paragraphs)
 
-                if not text_content.strip():
-                    raise HTTPException(status_code=400, detail="No text content found in DOCX file")
+        if not text_content.strip():
+            raise HTTPException(status_code=400, detail="No text content found in DOCX file")
 
-                return text_content
-
-        finally:
-            if temp_file and os.path.exists(temp_file):
-                try:
-                    os.unlink(temp_file)
-                except OSError:
-                    pass
+        return text_content
 
     @staticmethod
     async def _read_pdf_file(file: UploadFile) -> str:
         """Read PDF file using memory stream (no temp file needed)"""
         logger.info("Reading PDF file with name: " + file.filename)
-        content = await file.read()
 
         try:
             # Use BytesIO instead of temp file - more efficient
-            pdf_stream = BytesIO(content)
-            reader = PyPDF2.PdfReader(pdf_stream)
+            pdf_stream = BytesIO()
+            while chunk := await file.read(CHUNK_SIZE):
+                pdf_stream.write(chunk)
+            pdf_stream.seek(0)
 
-            if len(reader.pages) == 0:
-                raise HTTPException(status_code=400, detail="PDF file has no pages")
-
-            text_pages = []
-            for page in reader.pages:
-                page_text = page.extract_text()
-                if page_text:  # Only add non-empty pages
-                    text_pages.append(page_text)
+            # Extract in a worker thread so the event loop is not blocked
+            text_pages = await asyncio.to_thread(FileService._extract_pdf_pages, pdf_stream)
 
             full_text = "\n".join(text_pages)
 
@@ -188,3 +201,30 @@ class FileService:
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to process PDF file: {str(e)}")
 
+    @staticmethod
+    def _extract_pdf_pages(pdf_stream: BytesIO) -> list[str]:
+        """Extract the non-empty page texts of a PDF (blocking, runs off the event loop)"""
+        with _pdfium_lock:
+            # PDFium does the text extraction in native code
+            pdf = pdfium.PdfDocument(pdf_stream)
+            try:
+                if len(pdf) == 0:
+                    raise HTTPException(status_code=400, detail="PDF file has no pages")
+
+                text_pages = []
+                for page in pdf:
+                    page_text = page.get_textpage().get_text_bounded()
+                    if page_text:  # Only add non-empty pages
+                        text_pages.append(page_text)
+
+                return text_pages
+            finally:
+                pdf.close()
+
+
+# Reader for each supported input file extension
+_READERS = {
+    InputFileType.TEXT.value: FileService._read_txt_file,
+    InputFileType.DOCX.value: FileService._read_docx_file,
+    InputFileType.PDF.value: FileService._read_pdf_file,
+}
@@ -1,10 +1,17 @@
+import asyncio
+import hashlib
 import logging
 import os
+import random
 
+import httpx
+import orjson
+from cachetools import TTLCache
 from dotenv import load_dotenv
 from google import genai
 from google.genai.errors import APIError
-from google.genai.types import GenerateContentResponse
+from google.genai.types import GenerateContentResponse, HttpOptions
+from pydantic import ValidationError
 
 from app.schemas.exam import Exam
 
@@ -13,6 +20,30 @@ load_dotenv()
 # Module-level logger
 logger = logging.getLogger(__name__)
 
+# Gemini status codes worth retrying (rate limited / temporarily overloaded)
+RETRYABLE_STATUS_CODES = (429, 503)
+MAX_ATTEMPTS = 5
+MAX_BACKOFF_SECONDS = 30
+
+# Identical exam requests are served from the cache instead of calling Gemini again
+EXAM_CACHE_SIZE = 512
+EXAM_CACHE_TTL_SECONDS = 3600
+
+# Connection pool for the Gemini HTTP client, kept alive for the lifetime of the service
+GEMINI_CONNECTION_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20)
+
+# Prompt sent to Gemini, filled in by GeminiService.build_prompt
+_PROMPT_TEMPLATE = (
+    "Given the following exam guide content, generate mock exam questions (see specifications below) with answers. \n"
+    "- total number of questions: {num_questions} \n"
+    "- difficulty level: {difficulty} \n"
+    "- question types: {question_types} \n"
+    "- output format: JSON \n\n"
+    "- exam guide: {exam_guide} \n"
+    "- additional information: {additional_info} \n\n"
+    "Please ensure the output is a valid JSON object strictly conforming to the provided schema."
+)
+
 class GeminiService:
     def __init__(self, model_name: str = "gemini-2.5-flash"):
 
@@ -21,41 +52,92 @@ class GeminiService:
         if not self.api_key:
             raise ValueError("Google API key (GOOGLE_API_KEY) is not set. Please set it in your environment or .env file.")
 
-        # Explicitly pass the API key to the client
-        self.client = genai.Client(api_key=self.api_key)
+        # Explicitly pass the API key to the client, reusing pooled HTTP/2 connections across calls
+        self.client = genai.Client(
+            api_key=self.api_key,
+            http_options=HttpOptions(async_client_args={
+                "limits": GEMINI_CONNECTION_LIMITS,
+                "http2": True,
+            })
+        )
         self.model_name = model_name
 
+        # Cap the number of in-flight Gemini calls to stay under the API rate limits
+        self._sem = asyncio.Semaphore(int(os.getenv("GEMINI_MAX_CONCURRENCY", "8")))
+
+        self._exam_cache = TTLCache(maxsize=EXAM_CACHE_SIZE, ttl=EXAM_CACHE_TTL_SECONDS)
+
+        # Generate the response JSON schema once rather than on every Gemini call
+        self._response_schema = Exam.model_json_schema()
+
     @staticmethod
     def build_prompt(num_questions: int, difficulty: str, question_types: list, exam_guide: str, additional_info: str) -> str:
-        return (
-            f"Given the following exam guide content, generate mock exam questions (see specifications below) with answers. \n"
-            f"- total number of questions: {num_questions} \n"
-            f"- difficulty level: {difficulty} \n"
-            f"- question types: {', '.join(question_type for question_type in question_types)} \n"
-            f"- output format: JSON \n\n"
-            f"- exam guide: {exam_guide} \n"
-            f"- additional information: {additional_info} \n\n"
-            f"Please ensure the output is a valid JSON object strictly conforming to the provided schema."
+        return _PROMPT_TEMPLATE.format(
+            num_questions=num_questions,
+            difficulty=difficulty,
+            question_types=", ".join(question_types),
+            exam_guide=exam_guide,
+            additional_info=additional_info,
         )
 
-    def generate_exam(self, number_of_questions: int, difficulty: str, question_types: list, exam_guide: str, additional_info: str) -> GenerateContentResponse:
+    async def generate_exam(self, number_of_questions: int, difficulty: str, question_types: list, exam_guide: str, additional_info: str) -> Exam:
+        cache_key = self._exam_cache_key(number_of_questions, difficulty, question_types, exam_guide, additional_info)
+        cached_exam = self._exam_cache.get(cache_key)
+        if cached_exam is not None:
+            logger.info("Returning cached exam for key: %s", cache_key.hex())
+            return cached_exam
+
         try:
             logger.info("Calling Gemini API with number of questions: %d, difficulty: %s, question types: %s, exam guide: %s, additional info: %s")
             prompt = self.build_prompt(number_of_questions, difficulty, question_types, exam_guide, additional_info)
 
             logger.info("Calling Gemini API with prompt: %s", prompt)
-            response = self.client.models.generate_content(model=self.model_name,
-                                                           contents=prompt,
-                                                           config={
-                                                               "response_mime_type": "application/json",
-                                                               "response_schema": Exam,
-                                                           })
+            response = await self._generate_content(prompt)
 
             logger.info("Received response from Gemini API: %s", response)
-            return response
 
         except APIError as e:
             raise RuntimeError(f"Gemini API error occurred (status {e.code}): {e.message}") from e
 
         except Exception as e:
             raise RuntimeError(f"An unexpected error occurred during Gemini API call: {e}") from e
+
+        # With a JSON schema dict as `response_schema` the SDK hands back plain parsed JSON,
+        # so validate it into an `Exam` before it is cached or returned.
+        if not response.parsed:
+            raise RuntimeError("Gemini API returned an empty or unparseable response.")
+
+        try:
+            exam = Exam.model_validate(response.parsed)
+        except ValidationError as e:
+            raise RuntimeError(f"Gemini API returned an exam that does not match the schema: {e}") from e
+
+        self._exam_cache[cache_key] = exam
+        return exam
+
+    @staticmethod
+    def _exam_cache_key(number_of_questions: int, difficulty: str, question_types: list, exam_guide: str, additional_info: str) -> bytes:
+        """Build a stable hash of the exam request parameters"""
+        exam_guide_digest = hashlib.sha256(exam_guide.encode()).hexdigest()
+        payload = orjson.dumps([number_of_questions, difficulty, sorted(question_types), exam_guide_digest, additional_info])
+        return hashlib.blake2b(payload, digest_size=16).digest()
+
+    async def _generate_content(self, prompt: str) -> GenerateContentResponse:
+        """Call Gemini with bounded concurrency, backing off on 429/503 responses"""
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                async with self._sem:
+                    return await self.client.aio.models.generate_content(model=self.model_name,
+                                                                         contents=prompt,
+                                                                         config={
+                                                                             "response_mime_type": "application/json",
+                                                                             "response_schema": self._response_schema,
+                                                                         })
+            except APIError as e:
+                if e.code not in RETRYABLE_STATUS_CODES or attempt == MAX_ATTEMPTS - 1:
+                    raise
+
+                delay = min(2 ** attempt, MAX_BACKOFF_SECONDS) + random.random()
+                logger.warning("Gemini API returned status %s, retrying in %.1f seconds (attempt %d/%d)",
+                               e.code, delay, attempt + 1, MAX_ATTEMPTS)
+                await asyncio.sleep(delay)